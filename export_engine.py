@@ -0,0 +1,124 @@
+# export_engine.py
+# Confidential – Internal Use Only
+#
+# One-time export of the YOLO PPE model (best.pt) to a TensorRT engine.
+# The web apps load best.engine automatically when it exists next to best.pt.
+#
+# Usage:
+#   python export_engine.py                       # FP16 engine, imgsz=608, batch<=3
+#   python export_engine.py --imgsz 840 --batch 1 --out best_840.engine
+#                                                  # engine for web_helmet_app.py
+#   python export_engine.py --imgsz 840 --batch 1 --int8 --out best_840_int8.engine
+#                                                  # INT8 engine for web_helmet_app.py
+#   python export_engine.py --int8                 # INT8, calibrated on snapshots/raw/
+#   python export_engine.py --nms                  # NMS inside the engine (GPU)
+#
+# NOTE: the engine is built for ONE fixed imgsz. Keep YOLO_IMGSZ in the app
+#       equal to the value used here, otherwise TensorRT rejects the input.
+#       --batch is the MAX batch: multi_web_helmet_app.py sends one frame per
+#       camera in a single call, so keep it >= number of cameras.
+#
+# --nms: Ultralytics puts NMS into the exported graph, so TensorRT runs it on
+#   the GPU and the engine outputs final boxes; the predictor detects this
+#   from the engine metadata and skips its own NMS. Needs a recent
+#   ultralytics (nms export arg); older versions reject the argument.
+#
+# INT8:
+#   - Calibration images are the [<cam>_]no_helmet_*.jpg raw frames the apps
+#     keep in snapshots/raw/ next to every auto snapshot (real scenes from our
+#     cameras, WITHOUT the boxes / ROI / status text drawn on the snapshots
+#     themselves). calib/images is emptied and refilled on every run, newest
+#     first, max --calib-max files.
+#   - TensorRT's entropy calibrator only needs images, no labels. Weights are
+#     quantized per-channel by TensorRT itself, nothing to configure here.
+#   - Pass --val-data <dataset yaml WITH labels> to print mAP of the .pt and the
+#     INT8 engine; only ship the engine if mAP50-95 drops by less than ~1%.
+
+import os
+import glob
+import shutil
+import argparse
+from ultralytics import YOLO
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "best.pt")
+SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
+CALIB_RAW_DIR = os.path.join(SNAPSHOT_DIR, "raw")  # written by the web apps
+CALIB_DIR = os.path.join(BASE_DIR, "calib")
+
+parser = argparse.ArgumentParser(description="Export best.pt to TensorRT")
+parser.add_argument("--model", default=MODEL_PATH, help="path to .pt weights")
+parser.add_argument("--imgsz", type=int, default=608, help="fixed input size")
+parser.add_argument("--batch", type=int, default=3, help="max batch (number of cameras)")
+parser.add_argument("--workspace", type=int, default=4, help="TensorRT workspace (GB)")
+parser.add_argument("--int8", action="store_true", help="INT8 with calibration instead of FP16")
+parser.add_argument("--nms", action="store_true", help="run NMS inside the engine")
+parser.add_argument("--calib-src", default=CALIB_RAW_DIR, help="folder with calibration images")
+parser.add_argument("--calib-max", type=int, default=500, help="max calibration images")
+parser.add_argument("--val-data", default=None, help="labelled dataset yaml to compare mAP")
+parser.add_argument("--out", default=None, help="rename the engine (file name next to --model)")
+args = parser.parse_args()
+
+
+def build_calib_yaml(model):
+    """Copy up to --calib-max images into calib/images and write calib/calib.yaml."""
+    # <cam>_no_helmet_* (multi app) and no_helmet_* (web_helmet_app.py)
+    images = glob.glob(os.path.join(args.calib_src, "*no_helmet_*.jpg"))
+    # newest snapshots first, they match the current camera placement best
+    images = sorted(images, key=os.path.getmtime, reverse=True)[:args.calib_max]
+    if len(images) < 200:
+        print(f"[WARN] Only {len(images)} calibration images in {args.calib_src} "
+              f"(200-500 recommended)")
+    if not images:
+        raise SystemExit("[ERROR] No calibration images found")
+
+    # fresh set every run: leftovers would bypass --calib-max and skew the scales
+    img_dir = os.path.join(CALIB_DIR, "images")
+    shutil.rmtree(img_dir, ignore_errors=True)
+    os.makedirs(img_dir)
+    for path in images:
+        shutil.copy2(path, img_dir)
+
+    yaml_path = os.path.join(CALIB_DIR, "calib.yaml")
+    with open(yaml_path, "w") as f:
+        f.write(f"path: {CALIB_DIR}\n")
+        f.write("train: images\n")
+        f.write("val: images\n")
+        f.write("names:\n")
+        for cid, cname in model.names.items():
+            f.write(f"  {cid}: {cname}\n")
+    print(f"[INFO] Calibration set: {len(images)} images -> {yaml_path}")
+    return yaml_path
+
+
+model = YOLO(args.model)
+
+export_kwargs = dict(
+    format="engine",
+    imgsz=args.imgsz,
+    dynamic=args.batch > 1,
+    batch=args.batch,
+    workspace=args.workspace,
+)
+if args.int8:
+    export_kwargs.update(int8=True, data=build_calib_yaml(model))
+else:
+    export_kwargs.update(half=True)
+if args.nms:
+    export_kwargs.update(nms=True)
+
+engine_path = model.export(**export_kwargs)
+if args.out:
+    # e.g. best_840.engine, so engines for different imgsz/batch can coexist
+    out_path = os.path.join(os.path.dirname(os.path.abspath(engine_path)), args.out)
+    os.replace(engine_path, out_path)
+    engine_path = out_path
+print(f"[INFO] TensorRT engine saved: {engine_path}")
+
+if args.val_data:
+    base_map = YOLO(args.model).val(data=args.val_data, imgsz=args.imgsz).box.map
+    engine_map = YOLO(engine_path, task="detect").val(
+        data=args.val_data, imgsz=args.imgsz, batch=1
+    ).box.map
+    print(f"[INFO] mAP50-95: pt={base_map:.4f} engine={engine_map:.4f} "
+          f"diff={engine_map - base_map:+.4f}")
@@ -4,7 +4,11 @@
 # Flask web app for real-time helmet detection using YOLO PPE model (hardhat/no_hardhat).
 #
 # Logic:
-#   - Run YOLO on each frame (every RUN_EVERY_N frames) when detection is ON.
+#   - Run YOLO on each frame (every RUN_EVERY_N frames) when detection is ON;
+#     a motion spike forces a run on a skipped frame. The last boxes are
+#     redrawn on every frame in between.
+#   - One shared inference thread batches the newest frame of every camera
+#     into a single YOLO forward pass; generators only draw the results.
 #   - If any "no_hardhat" (no helmet) detection (inside ROI) => FAIL (red) for 2 seconds.
 #   - Else if any "hardhat" detection (inside ROI) => PASS (green) for 2 seconds.
 #
@@ -24,6 +28,8 @@
 # Multi-camera:
 #   - CAMERAS dict defines cam1, cam2, ... (RTSP URL + name).
 #   - Dropdown on UI selects active camera; all controls operate on selected cam.
+#   - One CameraWorker thread per camera opens RTSP once and does decode +
+#     detection logic + JPEG encode; every viewer of that camera shares it.
 #
 # ROI (Area trigger):
 #   - ROI_RECT per camera (x1, y1, x2, y2) in ORIGINAL frame coordinates.
@@ -42,12 +48,23 @@
 #   - PASS / FAIL big text OUTSIDE video, centered below, with counts + %.
 #   - Status label overlaid in top-left of video.
 #   - ROI rectangle overlaid on video.
+#   - /video_feed_h264?cam=... : same annotated stream as fragmented MP4 / H.264
+#     (ffmpeg, H264_ENCODER) for low-bandwidth viewers; /video_feed stays MJPEG.
 
 import os
+import math
 import time
+import queue
+import threading
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
+import torch
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ultralytics import YOLO
 from flask import (
     Flask,
@@ -58,6 +75,11 @@ from flask import (
     make_response,
 )
 
+try:
+    import simplejpeg  # libjpeg-turbo SIMD encoder, optional (pip install simplejpeg)
+except ImportError:
+    simplejpeg = None
+
 # ───────────────────────────────────────────────────────────────
 # CONFIG
 # ───────────────────────────────────────────────────────────────
@@ -86,15 +108,42 @@ CAMERA_IDS = list(CAMERAS.keys())
 
 # YOLO PPE model path (trained on dataset2 with hardhat/no_hardhat)
 YOLO_MODEL_PATH = os.path.join(BASE_DIR, "best.pt")
+# TensorRT engine exported from best.pt (python export_engine.py), used when present
+YOLO_ENGINE_PATH = os.path.join(BASE_DIR, "best.engine")
 
 # YOLO settings
 YOLO_CONF = 0.50
-YOLO_IMGSZ = 608
-RUN_EVERY_N = 2  # run YOLO every N frames for speed
+YOLO_IMGSZ = 608  # must match the imgsz the TensorRT engine was exported with
+
+# Per-box "[DETECT] label conf" lines (one per box per YOLO run): dev only.
+# DEBUG_DETECT=1 python multi_web_helmet_app.py
+DEBUG_DETECT = os.getenv("DEBUG_DETECT", "0") == "1"
+RUN_EVERY_N = 2  # run YOLO every N frames for speed (minimum; raised automatically
+                 # when YOLO can't keep up with the camera, see infer_period_ewma)
+EWMA_ALPHA = 0.1  # smoothing of the measured inference period / camera frame interval
+# skipped frames still go to YOLO when the scene changes a lot
+# (mean abs diff of a tiny gray thumbnail, 0..255)
+MOTION_THUMB_SIZE = (64, 36)
+MOTION_THRESH = 12.0
+INFER_INTERVAL_SEC = 0.03  # shared inference worker tick (batches all cameras)
+# max frames per forward pass: keep <= the --batch the engine was exported with
+# (export_engine.py, default 3); more cameras are split into several passes
+MAX_INFER_BATCH = 3
 
 # Display size
 MAX_WIDTH = 1048
 
+# MJPEG stream encoding (baseline JPEG, no Huffman optimize pass = fastest libjpeg path)
+JPEG_QUALITY = 70
+JPEG_ENCODE_PARAMS = [
+    cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+    cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+]
+# JPEG encode runs here (cv2 / libjpeg-turbo release the GIL), so a camera
+# worker can grab + process its next frame while the previous one encodes
+ENCODE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg-encode")
+
 # PASS / FAIL display window (seconds)
 PASS_SEC = 2.0
 FAIL_SEC = 2.0
@@ -104,6 +153,16 @@ os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
 os.environ["OPENCV_VIDEOIO_PRIORITY_MSMF"] = "0"
 os.environ["OPENCV_VIDEOIO_PRIORITY_FFMPEG"] = "1"
 
+# Hardware H.264 decode (NVIDIA NVDEC) through GStreamer, used when OpenCV is
+# built with GStreamer; falls back to FFMPEG (CPU). USE_GST_NVDEC=0 disables it.
+USE_GST_NVDEC = os.getenv("USE_GST_NVDEC", "1") == "1"
+GST_NVDEC_PIPELINE = (
+    "rtspsrc location={url} protocols=tcp latency=200 ! "
+    "rtph264depay ! h264parse ! nvv4l2decoder ! nvvidconv ! "
+    "video/x-raw,format=BGRx ! videoconvert ! video/x-raw,format=BGR ! "
+    "appsink drop=1 max-buffers=1 sync=false"
+)
+
 # ───────────────────────────────────────────────────────────────
 # SNAPSHOT CONFIG
 # ───────────────────────────────────────────────────────────────
@@ -111,11 +170,18 @@ os.environ["OPENCV_VIDEOIO_PRIORITY_FFMPEG"] = "1"
 SNAPSHOT_DIR = os.path.join(BASE_DIR, "snapshots")
 os.makedirs(SNAPSHOT_DIR, exist_ok=True)
 print(f"[INFO] Snapshot directory: {SNAPSHOT_DIR}")
+# raw (no overlays) copy of every auto NO_HELMET snapshot: the INT8
+# calibration set of export_engine.py
+CALIB_RAW_DIR = os.path.join(SNAPSHOT_DIR, "raw")
 
 # Auto snapshot interval options (seconds)
 SNAPSHOT_INTERVAL_OPTIONS = [3, 5, 10, 15, 30, 60]
 DEFAULT_SNAPSHOT_INTERVAL = 10
 
+# Snapshot JPEG encode + file write + Telegram hand-off run on a small pool
+SNAPSHOT_JPEG_QUALITY = 85
+SNAP_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="snapshot")
+
 # ───────────────────────────────────────────────────────────────
 # TELEGRAM CONFIG
 # ───────────────────────────────────────────────────────────────
@@ -131,9 +197,23 @@ CHAT_IDS = [
     -1003103459072  # supergroup
 ]
 
+# Sends run on a background thread so alerts never block the video stream
+TELEGRAM_QUEUE_SIZE = 64
 
-def send_telegram_photo(image_path, caption=""):
-    """Send a photo file to all CHAT_IDS via Telegram Bot API."""
+# keep-alive connection pool (no new TLS handshake per photo).
+# Retry only covers connect errors for POST, so a photo is never sent twice.
+tg_session = requests.Session()
+tg_session.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.3),
+))
+
+_tg_queue = queue.Queue(maxsize=TELEGRAM_QUEUE_SIZE)
+
+
+def _send_telegram_photo_sync(image_path, caption=""):
+    """Send a photo file to all CHAT_IDS via Telegram Bot API (blocking)."""
     if not TELEGRAM_BOT_TOKEN or "YOUR_BOT_TOKEN_HERE" in TELEGRAM_BOT_TOKEN:
         print("[TELEGRAM] Bot token not set. Skipping sendPhoto.")
         return
@@ -142,13 +222,17 @@ def send_telegram_photo(image_path, caption=""):
         print(f"[TELEGRAM] File does not exist: {image_path}")
         return
 
+    # read the file once, reuse the bytes for every chat
+    with open(image_path, "rb") as f:
+        photo_bytes = f.read()
+    filename = os.path.basename(image_path)
+    url = f"{TELEGRAM_API_URL}/sendPhoto"
+
     for chat_id in CHAT_IDS:
         try:
-            with open(image_path, "rb") as f:
-                files = {"photo": f}
-                data = {"chat_id": chat_id, "caption": caption}
-                url = f"{TELEGRAM_API_URL}/sendPhoto"
-                resp = requests.post(url, data=data, files=files, timeout=15)
+            files = {"photo": (filename, photo_bytes, "image/jpeg")}
+            data = {"chat_id": chat_id, "caption": caption}
+            resp = tg_session.post(url, data=data, files=files, timeout=15)
             if resp.status_code == 200:
                 print(f"[TELEGRAM] sendPhoto OK -> chat_id={chat_id}")
             else:
@@ -159,6 +243,24 @@ def send_telegram_photo(image_path, caption=""):
         except Exception as e:
             print(f"[TELEGRAM] Error sending photo to chat_id={chat_id}: {e}")
 
+
+def _tg_worker():
+    """Drain the Telegram queue forever (single sender thread)."""
+    while True:
+        image_path, caption = _tg_queue.get()
+        _send_telegram_photo_sync(image_path, caption)
+
+
+def send_telegram_photo(image_path, caption=""):
+    """Queue a photo for sending to all CHAT_IDS; never blocks the caller."""
+    try:
+        _tg_queue.put_nowait((image_path, caption))
+    except queue.Full:
+        print(f"[TELEGRAM] Send queue full, dropping photo: {image_path}")
+
+
+threading.Thread(target=_tg_worker, name="telegram-sender", daemon=True).start()
+
 # ───────────────────────────────────────────────────────────────
 # LOAD YOLO MODEL
 # ───────────────────────────────────────────────────────────────
@@ -166,9 +268,26 @@ def send_telegram_photo(image_path, caption=""):
 if not os.path.isfile(YOLO_MODEL_PATH):
     raise FileNotFoundError(f"YOLO model not found: {YOLO_MODEL_PATH}")
 
-print(f"[INFO] Loading YOLO PPE model from: {YOLO_MODEL_PATH}")
-helmet_model = YOLO(YOLO_MODEL_PATH)
+# CPU-only host: ALL cameras already share one batched forward pass (yolo-infer
+# thread), and Torch runs it on its own intra-op threads with the GIL released.
+# Leave one core per camera worker and make OpenCV single-threaded per call, so
+# camera threads + Torch don't oversubscribe the CPU.
+if not torch.cuda.is_available():
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) - len(CAMERA_IDS)))
+    cv2.setNumThreads(1)
+    print(f"[INFO] CPU inference: torch threads={torch.get_num_threads()}, "
+          f"camera workers={len(CAMERA_IDS)}")
+
+if os.path.isfile(YOLO_ENGINE_PATH):
+    print(f"[INFO] Loading TensorRT engine from: {YOLO_ENGINE_PATH}")
+    helmet_model = YOLO(YOLO_ENGINE_PATH, task="detect")
+else:
+    print(f"[INFO] Loading YOLO PPE model from: {YOLO_MODEL_PATH}")
+    print("[INFO] Tip: run export_engine.py once to build best.engine (TensorRT FP16)")
+    helmet_model = YOLO(YOLO_MODEL_PATH)
 CLASS_NAMES = helmet_model.names
+# Ultralytics class ids are dense 0..K-1 -> plain list indexed by id (used for drawing)
+CLASS_NAMES_LIST = [CLASS_NAMES[i] for i in range(len(CLASS_NAMES))]
 print("[INFO] Model classes:")
 for cid, cname in CLASS_NAMES.items():
     print(f"  id={cid}: {cname}")
@@ -177,41 +296,37 @@ for cid, cname in CLASS_NAMES.items():
 # GLOBAL STATE (PER CAMERA)
 # ───────────────────────────────────────────────────────────────
 
-# detection + snapshot config per camera
-state = {
+# Everything the camera worker and the Flask routes share for one camera,
+# kept in ONE record per camera. The worker looks its record up once and
+# then only does key access on a local, instead of 5 global dict lookups
+# per frame.
+#   detect_enabled / snapshot_interval_sec / send_mode ("auto" / "manual"):
+#       UI settings
+#   last_pass / last_fail: time of last helmet / no-helmet detection in ROI
+#   h / nh: helmet / no-helmet counts of the last detection run
+#       (last_pass .. nh are updated by tick_pass_fail)
+#   (all timestamps are time.monotonic() seconds, immune to NTP/clock jumps)
+#   last_snapshot_ts: time of the last auto snapshot
+#   last_frame: last displayed frame (with overlays) for manual snapshot
+#   status: payload for /latest_status, pass_fail = "pass" / "fail" / "none".
+#       Replaced as a whole, so a poll never sees a half-updated status.
+cam_state = {
     cam_id: {
         "detect_enabled": True,
         "snapshot_interval_sec": DEFAULT_SNAPSHOT_INTERVAL,
-    }
-    for cam_id in CAMERA_IDS
-}
-
-# send_mode: "auto" / "manual" per camera
-send_config = {
-    cam_id: {"mode": "auto"}
-    for cam_id in CAMERA_IDS
-}
-
-# PASS / FAIL timers per camera
-last_pass_ts = {cam_id: None for cam_id in CAMERA_IDS}
-last_fail_ts = {cam_id: None for cam_id in CAMERA_IDS}
-
-# Snapshot state per camera
-last_snapshot_ts = {cam_id: 0.0 for cam_id in CAMERA_IDS}
-last_frame_for_snapshot = {cam_id: None for cam_id in CAMERA_IDS}
-
-# For smoothed counts per camera
-last_helmet_count = {cam_id: 0 for cam_id in CAMERA_IDS}
-last_no_helmet_count = {cam_id: 0 for cam_id in CAMERA_IDS}
-
-# Status for web polling per camera
-# pass_fail: "pass", "fail", "none"
-last_status = {
-    cam_id: {
-        "pass_fail": "none",
-        "text": "NO DETECTION",
-        "helmet_count": 0,
-        "no_helmet_count": 0,
+        "send_mode": "auto",
+        "last_pass": float("-inf"),
+        "last_fail": float("-inf"),
+        "h": 0,
+        "nh": 0,
+        "last_snapshot_ts": float("-inf"),
+        "last_frame": None,
+        "status": {
+            "pass_fail": "none",
+            "text": "NO DETECTION",
+            "helmet_count": 0,
+            "no_helmet_count": 0,
+        },
     }
     for cam_id in CAMERA_IDS
 }
@@ -230,6 +345,12 @@ ROI_RECT = {
     "cam2": {"x1": 0, "y1": 0, "x2": 9999, "y2": 9999},  # TODO: set to real area
 }
 
+# ROI as int32 [x1, y1, x2, y2] per camera, built once for the vectorized check
+_ROI_CACHE = {
+    cam_id: np.array([cfg["x1"], cfg["y1"], cfg["x2"], cfg["y2"]], dtype=np.int32)
+    for cam_id, cfg in ROI_RECT.items()
+}
+
 # ───────────────────────────────────────────────────────────────
 # HELPER FUNCTIONS
 # ───────────────────────────────────────────────────────────────
@@ -239,7 +360,186 @@ def resize_for_display(frame, max_width=MAX_WIDTH):
     if w <= max_width:
         return frame
     scale = max_width / float(w)
-    return cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
+    # dims rounded down to multiples of 8 (OpenCV's vectorized loops, JPEG 8x8 blocks);
+    # INTER_AREA: only ever downscaling here, faster + sharper than INTER_LINEAR
+    new_w = int(w * scale) // 8 * 8
+    new_h = int(h * scale) // 8 * 8
+    return cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+
+# (cam_id, roi, frame_shape, show_shape, detect_enabled) -> (pixel_index, pixel_colors)
+# The ROI is part of the key, so a changed ROI simply misses the cache.
+_static_overlay_cache = {}
+
+
+def get_static_overlay(cam_id, frame_shape, show_shape, detect_enabled):
+    """
+    Render the static chrome of a camera ONCE per display size and ON/OFF:
+    ROI rectangle + "ROI" label and the "<cam> | Detection: ON/OFF" banner
+    (top-right). Returns (pixel_index, pixel_colors) so each frame only needs
+    a single fancy-index assignment over the overlay pixels.
+    Only the status line (top-left) is still drawn per frame.
+    """
+    roi_cfg = ROI_RECT.get(cam_id)  # read once: key and drawing use the same ROI
+    roi = (roi_cfg["x1"], roi_cfg["y1"], roi_cfg["x2"], roi_cfg["y2"]) if roi_cfg else None
+    key = (cam_id, roi, frame_shape, show_shape, detect_enabled)
+    overlay = _static_overlay_cache.get(key)
+    if overlay is not None:
+        return overlay
+
+    h, w = frame_shape
+    h_show, w_show = show_shape
+    canvas = np.zeros((h_show, w_show, 3), dtype=np.uint8)
+
+    if roi:
+        rx1, ry1, rx2, ry2 = roi
+        # clamp to original frame
+        rx1 = max(0, min(rx1, w - 1))
+        ry1 = max(0, min(ry1, h - 1))
+        rx2 = max(0, min(rx2, w))
+        ry2 = max(0, min(ry2, h))
+
+        scale_x = w_show / float(w)
+        scale_y = h_show / float(h)
+        rx1s = int(rx1 * scale_x)
+        ry1s = int(ry1 * scale_y)
+        rx2s = int(rx2 * scale_x)
+        ry2s = int(ry2 * scale_y)
+
+        cv2.rectangle(canvas, (rx1s, ry1s), (rx2s, ry2s), (0, 255, 255), 2)
+        cv2.putText(canvas, "ROI",
+                    (rx1s + 5, ry1s + 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                    (0, 255, 255), 2)
+
+    # Detection ON/OFF (top-right)
+    det_text = f"{CAMERAS[cam_id]['name']} | Detection: {'ON' if detect_enabled else 'OFF'}"
+    (tw, th), _ = cv2.getTextSize(det_text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+    cv2.putText(canvas, det_text,
+                (w_show - tw - 10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                (0, 255, 255), 2)
+
+    overlay_idx = np.nonzero(canvas.any(axis=2))
+    overlay = (overlay_idx, canvas[overlay_idx])
+    _static_overlay_cache[key] = overlay
+    return overlay
+
+
+def set_roi(cam_id, x1, y1, x2, y2):
+    """
+    Change the ROI of a camera (e.g. on a config reload). The overlay cache
+    is keyed on the ROI, so nothing rendered from the old one is reused.
+    """
+    ROI_RECT[cam_id] = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+    _ROI_CACHE[cam_id] = np.array([x1, y1, x2, y2], dtype=np.int32)
+
+
+PASS_FAIL_STATES = ("none", "pass", "fail")  # indexed by tick_pass_fail() code
+
+
+def tick_pass_fail(timers, now, detection_ran, frame_h, frame_nh):
+    """
+    PASS/FAIL state machine + count smoothing for one camera, one frame.
+    On a fresh detection run, a no-helmet in ROI refreshes last_fail, else
+    a helmet refreshes last_pass; counts are held between runs.
+    `timers` is the camera's cam_state record (last_pass/last_fail/h/nh).
+    Returns (code, helmet_count, no_helmet_count), code indexes PASS_FAIL_STATES.
+    """
+    if detection_ran:
+        timers["h"] = frame_h
+        timers["nh"] = frame_nh
+        if frame_nh > 0:
+            timers["last_fail"] = now
+        elif frame_h > 0:
+            timers["last_pass"] = now
+
+    code = 0
+    if now - timers["last_pass"] <= PASS_SEC:
+        code = 1
+    if now - timers["last_fail"] <= FAIL_SEC:
+        code = 2  # FAIL overrides PASS
+    return code, timers["h"], timers["nh"]
+
+
+def encode_jpeg(image):
+    """
+    MJPEG stream frame -> JPEG bytes (None on failure).
+    simplejpeg (libjpeg-turbo, fast DCT) when installed, else cv2.imencode.
+    """
+    if simplejpeg is not None:
+        return simplejpeg.encode_jpeg(
+            np.ascontiguousarray(image), quality=JPEG_QUALITY,
+            colorspace="BGR", fastdct=True,
+        )
+    ok, buffer = cv2.imencode(".jpg", image, JPEG_ENCODE_PARAMS)
+    return buffer.tobytes() if ok else None
+
+
+def has_gstreamer():
+    """True if this OpenCV build has the GStreamer video backend."""
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith("GStreamer:"):
+            return "YES" in line
+    return False
+
+
+HAS_GSTREAMER = has_gstreamer()
+
+
+def open_capture(cam_id, rtsp_url):
+    """
+    Open an RTSP stream: GStreamer + NVDEC first (if enabled and available),
+    then FFMPEG (CPU decode), then OpenCV's default backend.
+    """
+    if USE_GST_NVDEC and HAS_GSTREAMER:
+        cap = cv2.VideoCapture(GST_NVDEC_PIPELINE.format(url=rtsp_url), cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            print(f"[INFO] [{cam_id}] Using GStreamer NVDEC hardware decode")
+            return cap
+        print(f"[WARN] [{cam_id}] GStreamer NVDEC pipeline failed, falling back to FFMPEG...")
+        cap.release()
+
+    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        print(f"[WARN] [{cam_id}] FFMPEG backend failed, trying default backend...")
+        cap.release()
+        cap = cv2.VideoCapture(rtsp_url)
+    return cap
+
+
+class LatestFrameReader:
+    """
+    Reads a VideoCapture on its own thread and keeps ONLY the newest frame,
+    so a slow camera loop never makes the stream lag behind real time
+    (the capture is drained at camera speed, an unread frame is dropped).
+    """
+
+    def __init__(self, cam_id, cap):
+        self.cam_id = cam_id
+        self.cap = cap
+        self.cond = threading.Condition()
+        self.frame = None
+        self.thread = threading.Thread(target=self._run, name=f"rtsp-{cam_id}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            ret, frame = self.cap.read()
+            if not ret:
+                print(f"[WARN] [{self.cam_id}] Failed to read frame, retry...")
+                time.sleep(0.05)
+                continue
+            with self.cond:
+                self.frame = frame  # overwrite: older unread frame is dropped
+                self.cond.notify_all()
+
+    def read(self, timeout=1.0):
+        """Newest frame not returned before, or None on timeout."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame is not None, timeout)
+            frame, self.frame = self.frame, None
+            return frame
 
 
 def is_helmet_label(label):
@@ -267,29 +567,53 @@ def is_no_helmet_label(label):
 
 
 def save_snapshot(image, prefix="snap", send_to_telegram=False, camera_name="Camera"):
-    """Save a snapshot image to SNAPSHOT_DIR and (optionally) send to Telegram."""
-    try:
-        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
-    except Exception as e:
-        print(f"[SNAPSHOT] ERROR: could not create directory {SNAPSHOT_DIR}: {e}")
-
+    """
+    Queue a snapshot for SNAP_POOL (encode + write + Telegram) and return
+    its file path right away. `image` must not be drawn on afterwards (the
+    camera loop hands over a finished frame and moves on to a new array).
+    """
     ts_str = time.strftime("%Y%m%d_%H%M%S")
     filename = f"{prefix}_{ts_str}.jpg"
     filepath = os.path.join(SNAPSHOT_DIR, filename)
 
-    print(f"[SNAPSHOT] Trying to write file: {filepath}")
-    ok = cv2.imwrite(filepath, image)
-    if ok:
-        print(f"[SNAPSHOT] Saved snapshot: {filepath}")
-        if send_to_telegram:
-            human_time = time.strftime('%Y-%m-%d %H:%M:%S')
-            caption = f"{camera_name} | {prefix.upper()} | {human_time}"
-            send_telegram_photo(filepath, caption=caption)
-    else:
-        print(f"[SNAPSHOT] ERROR: Failed to save snapshot with cv2.imwrite: {filepath}")
+    caption = None
+    if send_to_telegram:
+        human_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        caption = f"{camera_name} | {prefix.upper()} | {human_time}"
+
+    SNAP_POOL.submit(_write_snapshot, filepath, image, caption)
     return filepath
 
 
+def save_calib_frame(image, prefix):
+    """Queue a raw camera frame (no overlays) for CALIB_RAW_DIR, same rules as save_snapshot."""
+    filename = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.jpg"
+    SNAP_POOL.submit(_write_snapshot, os.path.join(CALIB_RAW_DIR, filename), image)
+
+
+def _write_snapshot(filepath, image, caption=None):
+    """Encode + write snapshot to disk; queue it for Telegram if caption is set."""
+    out_dir = os.path.dirname(filepath)
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+    except Exception as e:
+        print(f"[SNAPSHOT] ERROR: could not create directory {out_dir}: {e}")
+
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_JPEG_QUALITY])
+    if not ok:
+        print(f"[SNAPSHOT] ERROR: Failed to encode snapshot: {filepath}")
+        return
+    try:
+        with open(filepath, "wb") as f:
+            f.write(buffer)
+    except OSError as e:
+        print(f"[SNAPSHOT] ERROR: Failed to write snapshot {filepath}: {e}")
+        return
+    print(f"[SNAPSHOT] Saved snapshot: {filepath}")
+    if caption is not None:
+        send_telegram_photo(filepath, caption=caption)
+
+
 def get_cam_from_request(default="cam1"):
     """Get camera id from ?cam= or JSON body; fallback to default."""
     cam_id = request.args.get("cam")
@@ -301,13 +625,168 @@ def get_cam_from_request(default="cam1"):
     return cam_id
 
 
-def point_in_roi(cam_id, x, y):
-    """Check if a point (x,y) in original frame coords lies inside ROI for that camera."""
-    cfg = ROI_RECT.get(cam_id)
-    if not cfg:
-        return True  # no ROI config -> treat as inside
-    x1, y1, x2, y2 = cfg["x1"], cfg["y1"], cfg["x2"], cfg["y2"]
-    return x1 <= x <= x2 and y1 <= y <= y2
+def boxes_in_roi(cam_id, xs, ys):
+    """
+    Vectorized ROI check: bool array telling which points (xs[i], ys[i])
+    in original frame coords lie inside the ROI of that camera.
+    """
+    roi = _ROI_CACHE.get(cam_id)
+    if roi is None:
+        return np.ones(len(xs), dtype=bool)  # no ROI config -> treat as inside
+    x1, y1, x2, y2 = roi
+    return (xs >= x1) & (xs <= x2) & (ys >= y1) & (ys <= y2)
+
+
+# Class id -> kind lookup table, resolved ONCE (no string matching per box)
+KIND_OTHER, KIND_HELMET, KIND_NO_HELMET = 0, 1, 2
+CLASS_KIND = np.zeros(max(CLASS_NAMES) + 1, dtype=np.uint8)
+for cid, cname in CLASS_NAMES.items():
+    if is_no_helmet_label(cname):
+        CLASS_KIND[cid] = KIND_NO_HELMET
+    elif is_helmet_label(cname):
+        CLASS_KIND[cid] = KIND_HELMET
+print(f"[INFO] Class kinds (0=other, 1=helmet, 2=no_helmet): {CLASS_KIND.tolist()}")
+
+
+def classify_boxes(cam_id, cxs, cys, cls_ids):
+    """
+    Vectorized ROI + class check for all boxes of one detection run
+    (box centers in original frame coords).
+    Returns (in_roi, helmet_mask, no_helmet_mask, helmet_count, no_helmet_count);
+    the counts include boxes INSIDE the ROI only.
+    """
+    in_roi = boxes_in_roi(cam_id, cxs, cys)
+    kinds = CLASS_KIND[cls_ids]
+    # both in-ROI tallies in ONE pass: count of each kind among boxes inside ROI
+    kind_counts = np.bincount(kinds[in_roi], minlength=3)
+    return (in_roi, kinds == KIND_HELMET, kinds == KIND_NO_HELMET,
+            int(kind_counts[KIND_HELMET]), int(kind_counts[KIND_NO_HELMET]))
+
+# ───────────────────────────────────────────────────────────────
+# SHARED INFERENCE WORKER (ALL CAMERAS IN ONE BATCH)
+# ───────────────────────────────────────────────────────────────
+
+# newest letterboxed frame per camera waiting for YOLO + "frame pending" flag
+latest_frame = {cam_id: None for cam_id in CAMERA_IDS}
+frame_ready = {cam_id: threading.Event() for cam_id in CAMERA_IDS}
+
+# (seq, dets) of the last YOLO run per camera; seq increments on every run.
+# dets = (xyxy int32 Nx4 in ORIGINAL frame coords, conf float Nx1, cls int32 Nx1)
+latest_results = {cam_id: (0, None) for cam_id in CAMERA_IDS}
+
+# smoothed time between two inference passes over the pending frames
+# (= how often each camera can get a YOLO result), written by inference_loop
+infer_period_ewma = 0.0
+
+# per camera: (frame_shape, r, new_wh, (left, top, right, bottom))
+_letterbox_cache = {}
+
+
+def letterbox_for_yolo(cam_id, frame, size=YOLO_IMGSZ):
+    """
+    Resize ONCE so the longest side is `size` and pad to size x size with
+    114 (same as Ultralytics), so YOLO doesn't resize the full frame again.
+    Scale/padding are cached per camera.
+    Returns (padded, (r, left, top)) to map boxes back to frame coords.
+    """
+    h, w = frame.shape[:2]
+    cached = _letterbox_cache.get(cam_id)
+    if cached is None or cached[0] != (h, w):
+        r = size / float(max(h, w))
+        new_w, new_h = int(round(w * r)), int(round(h * r))
+        left = (size - new_w) // 2
+        top = (size - new_h) // 2
+        cached = ((h, w), r, (new_w, new_h),
+                  (left, top, size - new_w - left, size - new_h - top))
+        _letterbox_cache[cam_id] = cached
+
+    _, r, new_wh, (left, top, right, bottom) = cached
+    small = cv2.resize(frame, new_wh, interpolation=cv2.INTER_LINEAR)
+    small = cv2.copyMakeBorder(small, top, bottom, left, right,
+                               cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return small, (r, left, top)
+
+
+def submit_for_inference(cam_id, frame, src_scale=(1.0, 1.0)):
+    """
+    Letterbox the newest frame of a camera and hand it to the inference worker.
+    `frame` may be a downscaled copy (the display frame): src_scale = (sx, sy)
+    is its size / original size, so boxes still come back in ORIGINAL coords.
+    """
+    small, (r, left, top) = letterbox_for_yolo(cam_id, frame)
+    sx, sy = src_scale
+    latest_frame[cam_id] = (small, (r * sx, r * sy, left, top))
+    frame_ready[cam_id].set()
+
+
+# own CUDA stream for YOLO, so its copies/kernels don't queue behind other
+# GPU work on the default stream (camera threads keep encoding JPEG on CPU)
+INFER_STREAM = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+
+def infer_batch(cam_ids, frames, scales):
+    """
+    ONE batched YOLO forward pass for the given cameras, then publish the
+    boxes (mapped back to original frame coords) into latest_results[cam_id].
+    """
+    stream_ctx = (torch.cuda.stream(INFER_STREAM) if INFER_STREAM is not None
+                  else contextlib.nullcontext())
+    try:
+        with stream_ctx:
+            results = helmet_model(frames, imgsz=YOLO_IMGSZ, conf=YOLO_CONF, verbose=False)
+            # ONE device->host copy per camera: (n, 6) = x1 y1 x2 y2 conf cls
+            datas = [res.boxes.data.cpu().numpy() for res in results]
+        if INFER_STREAM is not None:
+            INFER_STREAM.synchronize()
+    except Exception as e:
+        print(f"[ERROR] Inference failed for {cam_ids}: {e}")
+        datas = []
+    for cam_id, (rx, ry, left, top), data in zip(cam_ids, scales, datas):
+        xyxy = data[:, :4].copy()
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - left) / rx
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - top) / ry
+        dets = (
+            xyxy.astype(np.int32),
+            data[:, 4].copy(),
+            data[:, 5].astype(np.int32),
+        )
+        seq = latest_results[cam_id][0] + 1
+        latest_results[cam_id] = (seq, dets)
+
+
+def inference_loop():
+    """
+    Every INFER_INTERVAL_SEC collect the pending frame of each camera and
+    run them through YOLO in batches of at most MAX_INFER_BATCH frames.
+    """
+    global infer_period_ewma
+    while True:
+        t0 = time.monotonic()
+
+        cam_ids = []
+        frames = []
+        scales = []
+        for cam_id in CAMERA_IDS:
+            if frame_ready[cam_id].is_set():
+                frame_ready[cam_id].clear()
+                small, scale = latest_frame[cam_id]
+                cam_ids.append(cam_id)
+                frames.append(small)
+                scales.append(scale)
+
+        for i in range(0, len(frames), MAX_INFER_BATCH):
+            j = i + MAX_INFER_BATCH
+            infer_batch(cam_ids[i:j], frames[i:j], scales[i:j])
+
+        dt = time.monotonic() - t0
+        if frames:
+            period = max(dt, INFER_INTERVAL_SEC)
+            infer_period_ewma += EWMA_ALPHA * (period - infer_period_ewma)
+        if dt < INFER_INTERVAL_SEC:
+            time.sleep(INFER_INTERVAL_SEC - dt)
+
+
+threading.Thread(target=inference_loop, name="yolo-infer", daemon=True).start()
 
 # ───────────────────────────────────────────────────────────────
 # FLASK APP + HTML
@@ -662,42 +1141,44 @@ def index():
 
 @app.route("/detection_state")
 def detection_state():
-    cam_id = get_cam_from_request()
+    cs = cam_state[get_cam_from_request()]
     return jsonify({
-        "detect_enabled": state[cam_id]["detect_enabled"],
-        "snapshot_interval_sec": state[cam_id]["snapshot_interval_sec"],
-        "send_mode": send_config[cam_id]["mode"],
+        "detect_enabled": cs["detect_enabled"],
+        "snapshot_interval_sec": cs["snapshot_interval_sec"],
+        "send_mode": cs["send_mode"],
     })
 
 
 @app.route("/latest_status")
 def latest_status_endpoint():
     cam_id = get_cam_from_request()
-    return jsonify(last_status[cam_id])
+    return jsonify(cam_state[cam_id]["status"])
 
 
 @app.route("/toggle_detection", methods=["POST"])
 def toggle_detection():
     cam_id = get_cam_from_request()
-    cam_state = state[cam_id]
+    cs = cam_state[cam_id]
 
-    new_state = not cam_state["detect_enabled"]
-    cam_state["detect_enabled"] = new_state
+    new_state = not cs["detect_enabled"]
+    cs["detect_enabled"] = new_state
 
     if not new_state:
         # When turning OFF, clear timers & status
-        last_pass_ts[cam_id] = None
-        last_fail_ts[cam_id] = None
-        last_status[cam_id]["pass_fail"] = "none"
-        last_status[cam_id]["text"] = "DETECTION OFF"
-        last_status[cam_id]["helmet_count"] = 0
-        last_status[cam_id]["no_helmet_count"] = 0
+        cs["last_pass"] = float("-inf")
+        cs["last_fail"] = float("-inf")
+        cs["status"] = {
+            "pass_fail": "none",
+            "text": "DETECTION OFF",
+            "helmet_count": 0,
+            "no_helmet_count": 0,
+        }
 
     print(f"[INFO] [{cam_id}] Detection toggled -> {'ON' if new_state else 'OFF'}")
     return jsonify({
-        "detect_enabled": cam_state["detect_enabled"],
-        "snapshot_interval_sec": cam_state["snapshot_interval_sec"],
-        "send_mode": send_config[cam_id]["mode"],
+        "detect_enabled": cs["detect_enabled"],
+        "snapshot_interval_sec": cs["snapshot_interval_sec"],
+        "send_mode": cs["send_mode"],
     })
 
 
@@ -714,9 +1195,9 @@ def set_snapshot_interval():
     if sec not in SNAPSHOT_INTERVAL_OPTIONS:
         sec = DEFAULT_SNAPSHOT_INTERVAL
 
-    state[cam_id]["snapshot_interval_sec"] = sec
+    cam_state[cam_id]["snapshot_interval_sec"] = sec
     print(f"[INFO] [{cam_id}] Auto snapshot interval set to {sec} seconds")
-    return jsonify({"snapshot_interval_sec": state[cam_id]["snapshot_interval_sec"]})
+    return jsonify({"snapshot_interval_sec": cam_state[cam_id]["snapshot_interval_sec"]})
 
 
 @app.route("/set_send_mode", methods=["POST"])
@@ -727,16 +1208,16 @@ def set_send_mode():
     mode = data.get("mode", "auto")
     if mode not in ("auto", "manual"):
         mode = "auto"
-    send_config[cam_id]["mode"] = mode
+    cam_state[cam_id]["send_mode"] = mode
     print(f"[INFO] [{cam_id}] Send mode set to {mode}")
-    return jsonify({"mode": send_config[cam_id]["mode"]})
+    return jsonify({"mode": cam_state[cam_id]["send_mode"]})
 
 
 @app.route("/manual_snapshot", methods=["POST"])
 def manual_snapshot():
     """Manually save a snapshot of the latest frame and send to Telegram."""
     cam_id = get_cam_from_request()
-    frame = last_frame_for_snapshot[cam_id]
+    frame = cam_state[cam_id]["last_frame"]
     if frame is None:
         print(f"[SNAPSHOT] ERROR: manual snapshot requested but no frame yet ({cam_id})")
         return jsonify({"ok": False, "error": "No frame available yet"}), 500
@@ -750,223 +1231,350 @@ def manual_snapshot():
     return jsonify({"ok": True, "file": filepath})
 
 # ───────────────────────────────────────────────────────────────
-# FRAME GENERATOR (PER CAMERA with ROI)
+# CAMERA WORKERS (ONE RTSP DECODE PER CAMERA, SHARED BY ALL VIEWERS)
 # ───────────────────────────────────────────────────────────────
 
-def generate_frames(cam_id):
-    cam_cfg = CAMERAS[cam_id]
-    rtsp_url = cam_cfg["rtsp"]
-    cam_name = cam_cfg["name"]
+# fixed (text, BGR color) of the status line (top-left)
+STATUS_NO_DETECTION = ("NO DETECTION", (128, 128, 128))
+STATUS_NO_HELMET = ("NO HELMET (ALERT) [ROI]", (0, 0, 255))
+STATUS_HELMET = ("HELMET DETECTED [ROI]", (0, 255, 0))
+STATUS_OFF = ("DETECTION OFF", (128, 128, 128))
 
-    print(f"[INFO] [{cam_id}] Opening RTSP: {rtsp_url}")
-    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+# multipart framing: header + JPEG + CRLF are yielded as separate chunks,
+# so the JPEG bytes are never copied into a new per-frame string
+PART_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+PART_END = b"\r\n"
 
-    if not cap.isOpened():
-        print(f"[WARN] [{cam_id}] FFMPEG backend failed, trying default backend...")
-        cap.release()
-        cap = cv2.VideoCapture(rtsp_url)
 
-    if not cap.isOpened():
-        print(f"[ERROR] [{cam_id}] Cannot open RTSP stream.")
-        blank = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(blank, f"ERROR: Cannot open RTSP stream ({cam_id})",
-                    (20, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
-                    (0, 0, 255), 2)
-        ret, buffer = cv2.imencode(".jpg", blank)
-        frame = buffer.tobytes()
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-        return
+def make_error_jpeg(cam_id):
+    """JPEG bytes of the 'Cannot open RTSP stream' placeholder frame."""
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(blank, f"ERROR: Cannot open RTSP stream ({cam_id})",
+                (20, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                (0, 0, 255), 2)
+    return encode_jpeg(blank)
 
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
 
-    frame_idx = 0
+# encoded once at startup, reused on every failed open / reconnect
+_ERROR_JPEG = {cam_id: make_error_jpeg(cam_id) for cam_id in CAMERA_IDS}
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print(f"[WARN] [{cam_id}] Failed to read frame, retry...")
-            time.sleep(0.05)
-            continue
-
-        frame_idx += 1
-        draw = frame.copy()
-        h, w = frame.shape[:2]
-
-        detect_enabled = state[cam_id]["detect_enabled"]
-        snapshot_interval_sec = state[cam_id]["snapshot_interval_sec"]
-
-        # counts for THIS detection run (inside ROI only)
-        frame_helmet_count = 0
-        frame_no_helmet_count = 0
-        detection_ran = False
-
-        if detect_enabled and (frame_idx % RUN_EVERY_N == 0):
-            detection_ran = True
-            results = helmet_model(frame, imgsz=YOLO_IMGSZ, conf=YOLO_CONF, verbose=False)[0]
-
-            for box in results.boxes:
-                cls_id = int(box.cls[0])
-                conf = float(box.conf[0])
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                x1 = max(0, min(x1, w - 1))
-                y1 = max(0, min(y1, h - 1))
-                x2 = max(0, min(x2, w))
-                y2 = max(0, min(y2, h))
-
-                label = CLASS_NAMES.get(cls_id, str(cls_id))
-
-                # center of the bbox (for ROI)
-                cx = int((x1 + x2) / 2)
-                cy = int((y1 + y2) / 2)
-                in_roi = point_in_roi(cam_id, cx, cy)
-
-                # Debug confidence values
-                print(f"[DETECT] [{cam_id}] {label} conf={conf:.2f}, in_roi={in_roi}")
-
-                color = (255, 0, 0)  # default for other classes
-                if is_no_helmet_label(label):
-                    if in_roi:
-                        frame_no_helmet_count += 1
-                        color = (0, 0, 255)
-                    else:
-                        color = (0, 0, 150)
-                elif is_helmet_label(label):
-                    if in_roi:
-                        frame_helmet_count += 1
-                        color = (0, 255, 0)
-                    else:
-                        color = (0, 150, 0)
-
-                # draw bbox
-                cv2.rectangle(draw, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(draw, f"{label} {conf:.2f}",
+
+class CameraWorker(threading.Thread):
+    """
+    Owns the RTSP capture of ONE camera: decodes, runs the PASS/FAIL +
+    snapshot logic, draws overlays and encodes the JPEG once per frame.
+    Every /video_feed viewer of that camera only reads the latest JPEG.
+    """
+
+    def __init__(self, cam_id):
+        super().__init__(name=f"camera-{cam_id}", daemon=True)
+        self.cam_id = cam_id
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)  # notified by publish()
+        self.seq = 0        # increments on every new encoded frame
+        self.jpeg = None    # latest annotated frame (JPEG bytes)
+        self.opened = threading.Event()
+        self.failed = False
+        self.viewers = 0    # open /video_feed streams of this camera
+
+    def add_viewer(self):
+        with self.lock:
+            self.viewers += 1
+
+    def remove_viewer(self):
+        with self.lock:
+            self.viewers -= 1
+
+    def wait_frame(self, last_seq, timeout=1.0):
+        """
+        Block until a frame newer than `last_seq` is published (or timeout),
+        then return (seq, jpeg_bytes) of the newest annotated frame.
+        A slow viewer just skips to the newest frame, it never holds up the worker.
+        """
+        with self.new_frame:
+            self.new_frame.wait_for(lambda: self.seq != last_seq, timeout)
+            return self.seq, self.jpeg
+
+    def publish(self, frame_bytes):
+        with self.new_frame:
+            self.jpeg = frame_bytes
+            self.seq += 1
+            self.new_frame.notify_all()
+
+    def run(self):
+        cam_id = self.cam_id
+        cam_cfg = CAMERAS[cam_id]
+        rtsp_url = cam_cfg["rtsp"]
+        cam_name = cam_cfg["name"]
+        cs = cam_state[cam_id]
+
+        print(f"[INFO] [{cam_id}] Opening RTSP: {rtsp_url}")
+        cap = open_capture(cam_id, rtsp_url)
+
+        if not cap.isOpened():
+            print(f"[ERROR] [{cam_id}] Cannot open RTSP stream.")
+            self.failed = True
+            self.opened.set()
+            return
+
+        self.opened.set()
+        reader = LatestFrameReader(cam_id, cap)
+
+        frame_idx = 0
+        seen_seq = latest_results[cam_id][0]
+        prev_thumb = None
+        prev_frame_ts = None
+        frame_dt_ewma = 0.0  # smoothed interval between processed frames (resets with the worker)
+        pending_jpeg = None  # Future of the frame being encoded on ENCODE_POOL
+        # boxes of the last detection run in DISPLAY coords, redrawn on every
+        # frame until the next run: (x1, y1, x2, y2, cx, cy, label_text, color)
+        cached_boxes = []
+
+        while True:
+            frame = reader.read()
+            if frame is None:
+                continue
+
+            frame_idx += 1
+            h, w = frame.shape[:2]
+
+            now_ts = time.monotonic()
+            if prev_frame_ts is not None:
+                frame_dt_ewma += EWMA_ALPHA * ((now_ts - prev_frame_ts) - frame_dt_ewma)
+            prev_frame_ts = now_ts
+
+            # ONE downscale per frame: YOLO letterboxes from it and all
+            # overlays are drawn on it (never on the full-res frame)
+            frame_to_show = resize_for_display(frame, MAX_WIDTH)
+            h_show, w_show = frame_to_show.shape[:2]
+            sx, sy = w_show / w, h_show / h
+
+            detect_enabled = cs["detect_enabled"]
+            snapshot_interval_sec = cs["snapshot_interval_sec"]
+
+            # counts for THIS detection run (inside ROI only)
+            frame_helmet_count = 0
+            frame_no_helmet_count = 0
+            detection_ran = False
+
+            if detect_enabled:
+                # don't letterbox frames YOLO has no time for: skip as many
+                # frames as fit in one inference period (never less than RUN_EVERY_N)
+                run_every = RUN_EVERY_N
+                if frame_dt_ewma > 0:
+                    run_every = max(RUN_EVERY_N, math.ceil(infer_period_ewma / frame_dt_ewma))
+                run_now = frame_idx % run_every == 0
+                if not run_now:
+                    # skip frame: force a run anyway on a motion spike
+                    thumb = cv2.cvtColor(
+                        cv2.resize(frame_to_show, MOTION_THUMB_SIZE,
+                                   interpolation=cv2.INTER_NEAREST),
+                        cv2.COLOR_BGR2GRAY,
+                    )
+                    if prev_thumb is not None:
+                        run_now = cv2.absdiff(thumb, prev_thumb).mean() > MOTION_THRESH
+                    prev_thumb = thumb
+                if run_now:
+                    # letterboxing makes a new small image, so in-place drawing below is safe
+                    submit_for_inference(cam_id, frame_to_show, (sx, sy))
+            else:
+                cached_boxes = []
+
+            # boxes from the shared inference worker (only when a new run finished)
+            seq, dets = latest_results[cam_id]
+            if detect_enabled and seq != seen_seq and dets is not None:
+                detection_ran = True
+                xyxy, confs, cls_ids = dets
+
+                # clamp all boxes to the frame at once (dets is shared, don't modify it)
+                x1s = np.clip(xyxy[:, 0], 0, w - 1)
+                y1s = np.clip(xyxy[:, 1], 0, h - 1)
+                x2s = np.clip(xyxy[:, 2], 0, w)
+                y2s = np.clip(xyxy[:, 3], 0, h)
+
+                # center of each bbox (for ROI) + class masks + counts, vectorized
+                cxs = (x1s + x2s) // 2
+                cys = (y1s + y2s) // 2
+                (in_roi, helmet_mask, no_helmet_mask,
+                 frame_helmet_count, frame_no_helmet_count) = classify_boxes(
+                    cam_id, cxs, cys, cls_ids)
+
+                # ROI logic above is in original coords, drawing is in display coords
+                boxes = (np.stack([x1s, y1s, x2s, y2s, cxs, cys], axis=1)
+                         * (sx, sy, sx, sy, sx, sy)).astype(np.int32).tolist()
+                cached_boxes = []
+                for (x1, y1, x2, y2, cx, cy), conf, cls_id, is_nh, is_h, inside in zip(
+                        boxes, confs.tolist(), cls_ids.tolist(),
+                        no_helmet_mask.tolist(), helmet_mask.tolist(), in_roi.tolist()):
+                    label = CLASS_NAMES_LIST[cls_id]
+
+                    # Debug confidence values
+                    if DEBUG_DETECT:
+                        print(f"[DETECT] [{cam_id}] {label} conf={conf:.2f}, in_roi={inside}")
+
+                    color = (255, 0, 0)  # default for other classes
+                    if is_nh:
+                        color = (0, 0, 255) if inside else (0, 0, 150)
+                    elif is_h:
+                        color = (0, 255, 0) if inside else (0, 150, 0)
+
+                    cached_boxes.append((x1, y1, x2, y2, cx, cy, f"{label} {conf:.2f}", color))
+            seen_seq = seq
+
+            # logic for this frame (based ONLY on detections that were inside ROI)
+            any_no_helmet = detection_ran and frame_no_helmet_count > 0
+            any_helmet = detection_ran and frame_helmet_count > 0
+
+            # ───────────────────────────────────
+            # Decide PASS / FAIL for this moment
+            # ───────────────────────────────────
+            now = time.monotonic()
+
+            # timers + smoothed counts to send to UI (one call, no per-field lookups)
+            pf_code, helmet_count, no_helmet_count = tick_pass_fail(
+                cs, now, detection_ran,
+                frame_helmet_count, frame_no_helmet_count,
+            )
+
+            status_text, status_color = STATUS_NO_DETECTION
+            auto_snapshot_send = None  # set -> save an auto snapshot of this frame
+
+            if detect_enabled:
+                if any_no_helmet:
+                    status_text, status_color = STATUS_NO_HELMET
+
+                    # Auto snapshot on NO-HELMET in ROI with interval
+                    if now - cs["last_snapshot_ts"] > snapshot_interval_sec:
+                        send_to_tg = (cs["send_mode"] == "auto")
+                        print(
+                            f"[AUTO SNAPSHOT] [{cam_id}] NO HELMET in ROI at "
+                            f"{time.strftime('%H:%M:%S')}, interval={snapshot_interval_sec}s, "
+                            f"send_to_tg={send_to_tg}"
+                        )
+                        # saved below, once the overlays are on the frame
+                        auto_snapshot_send = send_to_tg
+                        # raw frame for INT8 calibration: nothing is drawn yet
+                        # (frame_to_show IS frame when no downscale was needed)
+                        save_calib_frame(frame.copy() if frame_to_show is frame else frame,
+                                         prefix=f"{cam_id}_no_helmet")
+                        cs["last_snapshot_ts"] = now
+
+                elif any_helmet:
+                    status_text, status_color = STATUS_HELMET
+            else:
+                status_text, status_color = STATUS_OFF
+
+            # PASS/FAIL state for info line
+            pass_fail_state = PASS_FAIL_STATES[pf_code] if detect_enabled else "none"
+
+            # Update shared status for /latest_status
+            cs["status"] = {
+                "pass_fail": pass_fail_state,
+                "text": status_text,
+                "helmet_count": helmet_count,
+                "no_helmet_count": no_helmet_count,
+            }
+
+            # ───────────────────────────────────
+            # Overlays in video
+            # ───────────────────────────────────
+            # draw the latest boxes on EVERY frame, not only when a run finished
+            # (drawing stays per box, OpenCV draws one shape per call)
+            for x1, y1, x2, y2, cx, cy, text, color in cached_boxes:
+                cv2.rectangle(frame_to_show, (x1, y1), (x2, y2), color, 2)
+                cv2.putText(frame_to_show, text,
                             (x1, max(y1 - 10, 20)),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
                 # draw center point
-                cv2.circle(draw, (cx, cy), 3, color, -1)
-
-        # logic for this frame (based ONLY on detections that were inside ROI)
-        any_no_helmet = detection_ran and frame_no_helmet_count > 0
-        any_helmet = detection_ran and frame_helmet_count > 0
-
-        # decide smoothed counts to send to UI
-        if detection_ran:
-            helmet_count = frame_helmet_count
-            no_helmet_count = frame_no_helmet_count
-            last_helmet_count[cam_id] = helmet_count
-            last_no_helmet_count[cam_id] = no_helmet_count
-        else:
-            helmet_count = last_helmet_count[cam_id]
-            no_helmet_count = last_no_helmet_count[cam_id]
-
-        # ───────────────────────────────────
-        # Decide PASS / FAIL for this moment
-        # ───────────────────────────────────
-        now = time.time()
-        status_text = "NO DETECTION"
-        status_color = (128, 128, 128)
-
-        if detect_enabled:
-            if any_no_helmet:
-                status_text = "NO HELMET (ALERT) [ROI]"
-                status_color = (0, 0, 255)
-                last_fail_ts[cam_id] = now
-
-                # Auto snapshot on NO-HELMET in ROI with interval
-                if now - last_snapshot_ts[cam_id] > snapshot_interval_sec:
-                    send_to_tg = (send_config[cam_id]["mode"] == "auto")
-                    print(
-                        f"[AUTO SNAPSHOT] [{cam_id}] NO HELMET in ROI at "
-                        f"{time.strftime('%H:%M:%S')}, interval={snapshot_interval_sec}s, "
-                        f"send_to_tg={send_to_tg}"
-                    )
-                    save_snapshot(
-                        draw,
-                        prefix=f"{cam_id}_no_helmet",
-                        send_to_telegram=send_to_tg,
-                        camera_name=cam_name,
-                    )
-                    last_snapshot_ts[cam_id] = now
-
-            elif any_helmet:
-                status_text = "HELMET DETECTED [ROI]"
-                status_color = (0, 255, 0)
-                last_pass_ts[cam_id] = now
-        else:
-            status_text = "DETECTION OFF"
-            status_color = (128, 128, 128)
-
-        # PASS/FAIL state for info line
-        pass_fail_state = "none"
-        if detect_enabled and last_pass_ts[cam_id] is not None and now - last_pass_ts[cam_id] <= PASS_SEC:
-            pass_fail_state = "pass"
-        if detect_enabled and last_fail_ts[cam_id] is not None and now - last_fail_ts[cam_id] <= FAIL_SEC:
-            # FAIL overrides PASS
-            pass_fail_state = "fail"
-
-        # Update shared status for /latest_status
-        last_status[cam_id]["pass_fail"] = pass_fail_state
-        last_status[cam_id]["text"] = status_text
-        last_status[cam_id]["helmet_count"] = helmet_count
-        last_status[cam_id]["no_helmet_count"] = no_helmet_count
-
-        # ───────────────────────────────────
-        # Overlays in video
-        # ───────────────────────────────────
-        frame_to_show = resize_for_display(draw, MAX_WIDTH)
-        h_show, w_show = frame_to_show.shape[:2]
-
-        # Keep last frame for manual snapshot (with overlays)
-        last_frame_for_snapshot[cam_id] = frame_to_show.copy()
-
-        # draw ROI rectangle (scaled to display size)
-        roi_cfg = ROI_RECT.get(cam_id)
-        if roi_cfg:
-            rx1, ry1, rx2, ry2 = roi_cfg["x1"], roi_cfg["y1"], roi_cfg["x2"], roi_cfg["y2"]
-            # clamp to original frame
-            rx1 = max(0, min(rx1, w - 1))
-            ry1 = max(0, min(ry1, h - 1))
-            rx2 = max(0, min(rx2, w))
-            ry2 = max(0, min(ry2, h))
-
-            scale_x = w_show / float(w)
-            scale_y = h_show / float(h)
-            rx1s = int(rx1 * scale_x)
-            ry1s = int(ry1 * scale_y)
-            rx2s = int(rx2 * scale_x)
-            ry2s = int(ry2 * scale_y)
-
-            cv2.rectangle(frame_to_show, (rx1s, ry1s), (rx2s, ry2s), (0, 255, 255), 2)
-            cv2.putText(frame_to_show, "ROI",
-                        (rx1s + 5, ry1s + 20),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                        (0, 255, 255), 2)
-
-        # Status (top-left)
-        cv2.putText(frame_to_show, status_text,
-                    (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8,
-                    status_color, 2)
-
-        # Detection ON/OFF (top-right)
-        det_text = f"{cam_name} | Detection: {'ON' if detect_enabled else 'OFF'}"
-        (tw, th), _ = cv2.getTextSize(det_text,
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-        cv2.putText(frame_to_show, det_text,
-                    (w_show - tw - 10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6,
-                    (0, 255, 255), 2)
+                cv2.circle(frame_to_show, (cx, cy), 3, color, -1)
+
+            # nobody watching -> detection/snapshots keep running, but skip
+            # overlay drawing + JPEG encode (nothing would send the bytes);
+            # an auto snapshot still gets its overlays
+            if self.viewers == 0 and auto_snapshot_send is None:
+                cs["last_frame"] = frame_to_show  # for manual snapshot, see below
+                # drop the in-flight encode: the next viewer must not get a
+                # frame from when the last one left
+                pending_jpeg = None
+                continue
+
+            # paste pre-rendered ROI rectangle + label and ON/OFF banner in one write
+            overlay_idx, overlay_colors = get_static_overlay(
+                cam_id, (h, w), (h_show, w_show), detect_enabled)
+            frame_to_show[overlay_idx] = overlay_colors
+
+            # Status (top-left), the only text that changes per frame
+            cv2.putText(frame_to_show, status_text,
+                        (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                        status_color, 2)
+
+            if auto_snapshot_send is not None:
+                save_snapshot(
+                    frame_to_show,
+                    prefix=f"{cam_id}_no_helmet",
+                    send_to_telegram=auto_snapshot_send,
+                    camera_name=cam_name,
+                )
+
+            # Keep last frame for manual snapshot (with overlays). No copy needed:
+            # frame_to_show is a new array every loop and is never drawn on
+            # after this point, so readers always see a finished frame.
+            cs["last_frame"] = frame_to_show
+
+            # JPEG encode: publish the previous frame (encoded while this one
+            # was processed), then hand this frame to the pool.
+            # One Future in flight per camera keeps frames in order.
+            if pending_jpeg is not None:
+                frame_bytes = pending_jpeg.result()
+                if frame_bytes is not None:
+                    self.publish(frame_bytes)
+            pending_jpeg = ENCODE_POOL.submit(encode_jpeg, frame_to_show)
+
+
+camera_workers = {}
+camera_workers_lock = threading.Lock()
+
+
+def get_camera_worker(cam_id):
+    """Start the worker of a camera on first use (or again if it failed to open)."""
+    with camera_workers_lock:
+        worker = camera_workers.get(cam_id)
+        if worker is None or worker.failed:
+            worker = CameraWorker(cam_id)
+            camera_workers[cam_id] = worker
+            worker.start()
+        return worker
+
+# ───────────────────────────────────────────────────────────────
+# FRAME GENERATOR (PER VIEWER, READS THE SHARED CAMERA WORKER)
+# ───────────────────────────────────────────────────────────────
 
-        # JPEG encode
-        ret2, buffer = cv2.imencode(".jpg", frame_to_show)
-        if not ret2:
-            continue
-        frame_bytes = buffer.tobytes()
+def generate_frames(cam_id):
+    worker = get_camera_worker(cam_id)
+    worker.opened.wait()
+
+    if worker.failed:
+        frame = _ERROR_JPEG[cam_id]
+        yield PART_HEADER % len(frame)
+        yield frame
+        yield PART_END
+        return
 
-        yield (b"--frame\r\n"
-               b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n")
+    worker.add_viewer()
+    try:
+        last_seq = 0
+        while True:
+            # wakes up as soon as the worker publishes (no polling interval)
+            seq, frame_bytes = worker.wait_frame(last_seq)
+            if seq != last_seq and frame_bytes is not None:
+                last_seq = seq
+                yield PART_HEADER % len(frame_bytes)
+                yield frame_bytes
+                yield PART_END
+    finally:
+        # client disconnected (GeneratorExit) -> worker may stop encoding
+        worker.remove_viewer()
 
 
 @app.route("/video_feed")
@@ -982,6 +1590,93 @@ def video_feed():
     return resp
 
 
+# ───────────────────────────────────────────────────────────────
+# H.264 STREAM (fragmented MP4, for viewers on slow / WAN links)
+# ───────────────────────────────────────────────────────────────
+
+# ffmpeg re-encodes the worker's annotated JPEGs to H.264: one process per
+# viewer (every fMP4 stream needs its own init segment). /video_feed (MJPEG)
+# stays for LAN / debug.
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+# h264_nvenc (NVIDIA), h264_vaapi (Intel/AMD), h264_videotoolbox (Mac), libx264 (CPU)
+H264_ENCODER = os.environ.get("H264_ENCODER", "h264_nvenc")
+H264_ENCODER_OPTS = {
+    "h264_nvenc": ["-preset", "p1", "-tune", "ll"],
+    "libx264": ["-preset", "ultrafast", "-tune", "zerolatency"],
+    "h264_videotoolbox": ["-realtime", "1"],
+}
+H264_GOP = 25  # keyframe (= new fMP4 fragment) every N frames
+
+
+def h264_command():
+    return [
+        FFMPEG_BIN, "-loglevel", "error",
+        "-use_wallclock_as_timestamps", "1",
+        "-f", "mjpeg", "-i", "-",
+        "-c:v", H264_ENCODER, *H264_ENCODER_OPTS.get(H264_ENCODER, []),
+        "-g", str(H264_GOP), "-bf", "0", "-pix_fmt", "yuv420p",
+        "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-",
+    ]
+
+
+def _feed_ffmpeg(worker, proc, stop):
+    """Pipe every new annotated JPEG of the camera into ffmpeg's stdin."""
+    last_seq = 0
+    try:
+        while not stop.is_set():
+            seq, frame_bytes = worker.wait_frame(last_seq)
+            if seq != last_seq and frame_bytes is not None:
+                last_seq = seq
+                proc.stdin.write(frame_bytes)
+                proc.stdin.flush()
+    except (BrokenPipeError, ValueError, OSError):
+        pass  # ffmpeg exited / viewer gone
+
+
+def generate_h264(cam_id, worker, proc):
+    """fMP4 bytes of ffmpeg `proc`, fed from the (opened) camera `worker`."""
+    stop = threading.Event()
+    worker.add_viewer()
+    threading.Thread(target=_feed_ffmpeg, args=(worker, proc, stop),
+                     name=f"h264-feed-{cam_id}", daemon=True).start()
+    try:
+        while True:
+            chunk = proc.stdout.read1(65536)
+            if not chunk:
+                print(f"[WARN] [{cam_id}] ffmpeg H.264 stream ended")
+                break
+            yield chunk
+    finally:
+        stop.set()
+        worker.remove_viewer()
+        proc.kill()
+        proc.wait()
+
+
+@app.route("/video_feed_h264")
+def video_feed_h264():
+    cam_id = get_cam_from_request()
+    # fail before streaming starts, so the client gets a status instead of
+    # an empty 200 it can't tell apart from a slow start
+    worker = get_camera_worker(cam_id)
+    worker.opened.wait()
+    if worker.failed:
+        return jsonify({"ok": False, "error": f"Cannot open camera {cam_id}"}), 503
+
+    try:
+        proc = subprocess.Popen(h264_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    except OSError as e:
+        print(f"[ERROR] [{cam_id}] Cannot start ffmpeg ({FFMPEG_BIN}): {e}")
+        return jsonify({"ok": False, "error": "Cannot start ffmpeg"}), 503
+
+    resp = Response(generate_h264(cam_id, worker, proc), mimetype="video/mp4")
+    resp.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    resp.headers["Pragma"] = "no-cache"
+    resp.headers["Expires"] = "0"
+    return resp
+
+
 if __name__ == "__main__":
     # Use 5050 or any free port you like
     app.run(host="0.0.0.0", port=5050, debug=False, threaded=True)
@@ -1,9 +1,52 @@
 import cv2
 import platform
+import queue
+import threading
 
 CAM_INDEX = 0
 IS_MAC = platform.system() == "Darwin"
 
+# ask the webcam for MJPG (camera compresses, far less USB bandwidth than YUYV)
+CAM_FOURCC = "MJPG"
+CAM_WIDTH = 1280
+CAM_HEIGHT = 720
+CAM_FPS = 30
+
+
+class FrameGrabber:
+    """Reads the camera on a background thread; keeps only the newest frame."""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.q = queue.Queue(maxsize=1)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                frame = None  # tells the main loop the stream ended
+                self.running = False
+            try:
+                self.q.put_nowait(frame)
+            except queue.Full:
+                # drop the frame nobody displayed yet, keep the newest
+                try:
+                    self.q.get_nowait()
+                except queue.Empty:
+                    pass
+                self.q.put_nowait(frame)
+
+    def read(self):
+        return self.q.get()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+
+
 if IS_MAC:
     cap = cv2.VideoCapture(CAM_INDEX, cv2.CAP_AVFOUNDATION)
 else:
@@ -13,14 +56,26 @@ if not cap.isOpened():
     print("Cannot open camera")
     exit()
 
+cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*CAM_FOURCC))
+cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
+cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAM_HEIGHT)
+cap.set(cv2.CAP_PROP_FPS, CAM_FPS)
+fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+fourcc_str = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+print(f"Camera: {fourcc_str} {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x"
+      f"{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} @ {cap.get(cv2.CAP_PROP_FPS):.0f} fps")
+
+grabber = FrameGrabber(cap)
+
 while True:
-    ret, frame = cap.read()
-    if not ret:
+    frame = grabber.read()
+    if frame is None:
         print("Can't receive frame (stream end?). Exiting ...")
         break
     cv2.imshow('test webcam - press q to quit', frame)
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+grabber.stop()
 cap.release()
 cv2.destroyAllWindows()
@@ -0,0 +1,35 @@
+# adaptive_detect.py
+# Confidential – Internal Use Only
+#
+# Shared helper for the detect scripts in training/:
+# run a cheap imgsz=640 pass first and only pay for imgsz=1280 when the
+# scene needs it (crowd, boxes close to the confidence threshold, or nothing
+# found at all: small / distant people are exactly what 640 + conf 0.25 misses).
+# Needs a model that accepts both sizes: .pt, or an export with dynamic=True.
+
+IMGSZ_FAST = 640
+IMGSZ_FULL = 1280
+CROWD_THRESHOLD = 8      # >= this many boxes at 640 -> re-run at 1280
+NEAR_CONF_MARGIN = 0.10  # any box below conf_fast + margin -> re-run at 1280
+
+
+def infer_adaptive(model, img, classes=None, conf_fast=0.25, conf_full=0.10,
+                   crowd_threshold=CROWD_THRESHOLD, escalate_empty=True,
+                   **predict_kwargs):
+    """
+    YOLO on one image with an adaptive input size. Class filtering happens
+    inside predict (NMS), extra kwargs (e.g. iou) go to both passes.
+    escalate_empty=False keeps an empty 640 result (faster on mostly empty
+    scenes, but small / distant people the 1280 pass would find are missed).
+    Returns (results, imgsz_used).
+    """
+    results = model(img, imgsz=IMGSZ_FAST, conf=conf_fast, classes=classes,
+                    verbose=False, **predict_kwargs)
+    confs = results[0].boxes.conf
+    n = len(confs)
+    if ((n == 0 and escalate_empty) or n >= crowd_threshold
+            or (n and float(confs.min()) < conf_fast + NEAR_CONF_MARGIN)):
+        results = model(img, imgsz=IMGSZ_FULL, conf=conf_full, classes=classes,
+                        verbose=False, **predict_kwargs)
+        return results, IMGSZ_FULL
+    return results, IMGSZ_FAST
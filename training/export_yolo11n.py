@@ -0,0 +1,33 @@
+# export_yolo11n.py
+# Confidential – Internal Use Only
+#
+# One-time export of model/yolo11n.pt for the detection scripts in training/:
+#   - NVIDIA GPU -> TensorRT FP16 engine   (model/yolo11n.engine)
+#   - CPU only   -> OpenVINO FP16 IR       (model/yolo11n_openvino_model/)
+# The scripts load the exported model when it exists, else fall back to .pt.
+# Keep .pt for training (train.py), exported formats are inference only.
+#
+# dynamic=True with imgsz=1280 (= max size): the same export serves
+# image_detect_test.py / image_predict.py (640) and multiple_people_detect.py (1280).
+#
+# Usage (from training/):
+#   python export_yolo11n.py                 # auto: engine on CUDA, else openvino
+#   python export_yolo11n.py --format openvino
+
+import argparse
+import torch
+from ultralytics import YOLO
+
+MODEL_PATH = "model/yolo11n.pt"
+
+parser = argparse.ArgumentParser(description="Export yolo11n.pt for inference")
+parser.add_argument("--format", choices=["engine", "openvino"], default=None,
+                    help="default: engine if CUDA is available, else openvino")
+parser.add_argument("--imgsz", type=int, default=1280, help="max input size")
+args = parser.parse_args()
+
+fmt = args.format or ("engine" if torch.cuda.is_available() else "openvino")
+
+model = YOLO(MODEL_PATH)
+out_path = model.export(format=fmt, imgsz=args.imgsz, half=True, dynamic=True)
+print("Exported:", out_path)
@@ -21,8 +21,11 @@ if img is None:
 # double-check type is numpy.ndarray
 print("isinstance(img, np.ndarray)?", isinstance(img, np.ndarray))
 
-# 2. Load YOLO11n
-model = YOLO("model/yolo11n.pt")  # auto-downloads if missing
+# 2. Load YOLO11n: exported TensorRT / OpenVINO model (export_yolo11n.py) if present
+MODEL_EXPORTED = ["model/yolo11n.engine", "model/yolo11n_openvino_model"]
+model_path = next((p for p in MODEL_EXPORTED if os.path.exists(p)), "model/yolo11n.pt")
+model = YOLO(model_path, task="detect")  # .pt auto-downloads if missing
+print("Model:", model_path)
 
 
 # 3. Run detection on the numpy image instead of filename
@@ -31,12 +34,11 @@ results = model(img, conf=0.25, imgsz=640, classes=[0]) # predict on the image a
 res = results[0]
 print("Detections:", len(res.boxes))
 
-for box in res.boxes:
-    cls_id = int(box.cls[0]) # class id
-    conf = float(box.conf[0]) # confidence
-    xyxy = box.xyxy[0].tolist() # bounding box
-    label = model.names[cls_id] # class name
-    print(f"{label}: {conf:.2f} -> {xyxy}") # bounding box details
+# ONE device->host copy for all boxes: (N, 6) = x1 y1 x2 y2 conf cls
+data = res.boxes.data.cpu().numpy()
+for x1, y1, x2, y2, conf, cls_id in data.tolist():
+    label = model.names[int(cls_id)] # class name
+    print(f"{label}: {conf:.2f} -> {[x1, y1, x2, y2]}") # bounding box details
 
 annotated = res.plot()
 out_path = "/Users/piriya/kbs_qc_ai_camera/training/picture_detected.jpg"
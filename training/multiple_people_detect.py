@@ -2,28 +2,39 @@ from ultralytics import YOLO
 import cv2
 import numpy as np
 import os
+from adaptive_detect import infer_adaptive
 
 IMAGE_PATH = "/Users/piriya/kbs_qc_ai_camera/training/p6.png"
 
 img = cv2.imread(IMAGE_PATH)
-model = YOLO("model/yolo11n.pt")
+# exported model if present, else .pt:
+#   GPU: TensorRT engine (export_yolo11n.py)
+#   CPU: INT8 ONNX (quantize_yolo11n_int8.py), then OpenVINO FP16
+# (all dynamic-shape, infer_adaptive runs them at 640 and 1280)
+MODEL_EXPORTED = [
+    "model/yolo11n.engine",
+    "model/yolo11n_int8.onnx",
+    "model/yolo11n_openvino_model",
+]
+model_path = next((p for p in MODEL_EXPORTED if os.path.exists(p)), "model/yolo11n.pt")
+model = YOLO(model_path, task="detect")
 
-results = model(
+# 640 first, 1280 (conf=0.10) only for crowds / low-confidence boxes
+results, imgsz_used = infer_adaptive(
+    model,
     img,
-    conf=0.10,
-    imgsz=1280,
+    classes=[0],  # detect person only
     iou=0.45,
-    classes=[0]   # detect person only
 )
+print("imgsz used:", imgsz_used)
 
 res = results[0]
 print("Number of people detected:", len(res.boxes))
 
-for box in res.boxes:
-    cls_id = int(box.cls[0])
-    conf = float(box.conf[0])
-    xyxy = box.xyxy[0].tolist()
-    print(f"person: {conf:.2f} -> {xyxy}")
+# ONE device->host copy for all boxes: (N, 6) = x1 y1 x2 y2 conf cls
+data = res.boxes.data.cpu().numpy()
+for x1, y1, x2, y2, conf, cls_id in data.tolist():
+    print(f"person: {conf:.2f} -> {[x1, y1, x2, y2]}")
 
 annotated = res.plot()
 cv2.imshow("Annotated Image", annotated)
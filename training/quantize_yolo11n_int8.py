@@ -0,0 +1,92 @@
+# quantize_yolo11n_int8.py
+# Confidential – Internal Use Only
+#
+# INT8 post-training quantization of yolo11n for CPU inference
+# (multiple_people_detect.py runs imgsz=1280 on CPU).
+#
+#   1. export model/yolo11n.pt -> model/yolo11n.onnx (dynamic shape, so
+#      adaptive_detect.py can run it at 640 and 1280)
+#   2. calibrate at 1280 on frames from dataset_raw_frames/ (100-300 images is enough)
+#   3. write model/yolo11n_int8.onnx (QDQ, int8 weights per-channel, uint8 activations)
+#
+# Needs: pip install onnx onnxruntime
+# Check detections against the .pt on a few images before relying on it.
+#
+# Usage (from training/):
+#   python quantize_yolo11n_int8.py
+#   python quantize_yolo11n_int8.py --calib-dir dataset_raw_frames --calib-max 200
+
+import os
+import glob
+import argparse
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_static,
+)
+
+MODEL_PATH = "model/yolo11n.pt"
+INT8_PATH = "model/yolo11n_int8.onnx"
+
+parser = argparse.ArgumentParser(description="INT8 quantize yolo11n (ONNX Runtime)")
+parser.add_argument("--imgsz", type=int, default=1280)
+parser.add_argument("--calib-dir", default="dataset_raw_frames")
+parser.add_argument("--calib-max", type=int, default=200)
+args = parser.parse_args()
+
+
+def letterbox(img, size):
+    """Same preprocessing as Ultralytics: keep ratio, pad with 114, BGR->RGB, NCHW 0..1."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    img = cv2.copyMakeBorder(img, top, size - new_h - top, left, size - new_w - left,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    img = img[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(img, dtype=np.float32)[None] / 255.0
+
+
+class FrameReader(CalibrationDataReader):
+    """Feeds calibration frames to ONNX Runtime one at a time."""
+
+    def __init__(self, input_name, paths, size):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.size = size
+
+    def get_next(self):
+        for path in self.paths:
+            img = cv2.imread(path)
+            if img is not None:
+                return {self.input_name: letterbox(img, self.size)}
+        return None
+
+
+paths = sorted(
+    glob.glob(os.path.join(args.calib_dir, "*.jpg"))
+    + glob.glob(os.path.join(args.calib_dir, "*.png"))
+)[:args.calib_max]
+if not paths:
+    raise RuntimeError(f"No calibration images in {args.calib_dir}")
+print("Calibration images:", len(paths))
+
+onnx_path = YOLO(MODEL_PATH).export(format="onnx", imgsz=args.imgsz, dynamic=True)
+print("Exported:", onnx_path)
+
+quantize_static(
+    onnx_path,
+    INT8_PATH,
+    FrameReader("images", paths, args.imgsz),  # "images" = Ultralytics ONNX input name
+    quant_format=QuantFormat.QDQ,
+    activation_type=QuantType.QUInt8,
+    weight_type=QuantType.QInt8,
+    per_channel=True,
+)
+print("Saved:", INT8_PATH)